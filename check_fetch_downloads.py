@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+
+End-to-end check for fetch_downloads.py against a local file server:
+- Write sample files into a temp dir: two identical PDFs, one different PDF and one HTML page
+- Serve them with http.server on a free localhost port
+- Write pattern JSONs whose download_links point at them, plus a Ravelry nav tab and a 404
+- Run the download-content stage twice and check:
+    - identical PDFs are stored once (content-addressed)
+    - PDF and HTML text is extracted and attached as download_content
+    - the nav tab is never requested; the 404 is recorded as an error entry
+    - a download redirected to a login page is recorded as an error, not stored
+    - the second run only re-requests the failed URLs; --refetch requests everything again
+    - unchanged records are not rewritten; the master dataset carries download_content
+
+Usage:
+python check_fetch_downloads.py
+
+Requires: requests, beautifulsoup4, pypdf (same as fetch_downloads.py)
+"""
+import os
+import sys
+import json
+import tempfile
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import fetch_downloads
+
+def make_pdf(text):
+    """
+    Minimal single-page PDF with one line of Helvetica text.
+    """
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<</Type/Catalog/Pages 2 0 R>>",
+        b"<</Type/Pages/Kids[3 0 R]/Count 1>>",
+        b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R/Resources<</Font<</F1 5 0 R>>>>>>",
+        b"<</Length %d>>stream\n" % len(stream) + stream + b"\nendstream",
+        b"<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF" % (len(objects) + 1, xref)
+    return out
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    requested = []
+
+    def do_GET(self):
+        RecordingHandler.requested.append(self.path)
+        if self.path == "/locked.pdf":
+            # what Ravelry does for /dl/ links without a logged-in session
+            self.send_response(302)
+            self.send_header("Location", "/account/login")
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def log_message(self, fmt, *args):
+        pass
+
+def check(cond, msg):
+    print(("✅ " if cond else "❌ ") + msg)
+    return cond
+
+def main():
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        json_dir = os.path.join(tmp, "json")
+        out_dir = os.path.join(tmp, "store")
+        master = os.path.join(tmp, "patterns_dataset.json")
+        os.makedirs(srv_dir)
+        os.makedirs(json_dir)
+
+        with open(os.path.join(srv_dir, "a.pdf"), "wb") as f:
+            f.write(make_pdf("Cast on 8 sts and join to work in the round"))
+        with open(os.path.join(srv_dir, "a_copy.pdf"), "wb") as f:
+            f.write(make_pdf("Cast on 8 sts and join to work in the round"))
+        with open(os.path.join(srv_dir, "b.pdf"), "wb") as f:
+            f.write(make_pdf("Decrease every round until 6 sts remain"))
+        os.makedirs(os.path.join(srv_dir, "account"))
+        with open(os.path.join(srv_dir, "account", "login"), "w", encoding="utf-8") as f:
+            f.write("<html><body>Log in to Ravelry</body></html>")
+        with open(os.path.join(srv_dir, "notes.html"), "w", encoding="utf-8") as f:
+            f.write("<html><script>var x;</script><body><p>Stuff the ball firmly.</p></body></html>")
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RecordingHandler, directory=srv_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        patterns = {
+            1: [f"{base}/a.pdf", f"{base}/b.pdf", f"{base}/notes.html",
+                f"{base}/patterns/library/sample/comments", f"{base}/missing.pdf",
+                f"{base}/locked.pdf"],
+            2: [f"{base}/a_copy.pdf", f"{base}/a.pdf"],
+        }
+        for pid, links in patterns.items():
+            with open(os.path.join(json_dir, f"{pid}.json"), "w", encoding="utf-8") as f:
+                json.dump({"pattern_id": pid, "download_links": links}, f)
+
+        try:
+            fetch_downloads.run(json_dir, out_dir, threads=4, procs=2, master_json=master)
+            first = list(RecordingHandler.requested)
+            mtime = os.stat(os.path.join(json_dir, "2.json")).st_mtime_ns
+            RecordingHandler.requested.clear()
+            records = fetch_downloads.run(json_dir, out_dir, threads=4, procs=2, master_json=master)
+            second = list(RecordingHandler.requested)
+            unchanged = os.stat(os.path.join(json_dir, "2.json")).st_mtime_ns == mtime
+            RecordingHandler.requested.clear()
+            fetch_downloads.run(json_dir, out_dir, threads=4, procs=2, refetch=True, master_json=master)
+            third = list(RecordingHandler.requested)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        content = {os.path.basename(p): rec["download_content"] for p, rec in records.items()}
+        by_url = {e["url"].replace(base, ""): e for entries in content.values() for e in entries}
+
+        ok &= check(len(os.listdir(out_dir)) == 3, "identical PDFs stored once (3 files for 4 fetched URLs)")
+        ok &= check(by_url["/a.pdf"]["sha256"] == by_url["/a_copy.pdf"]["sha256"], "duplicate PDFs share a sha256")
+        ok &= check("work in the round" in by_url["/a.pdf"].get("text", ""), "PDF text extracted")
+        ok &= check("6 sts remain" in by_url["/b.pdf"].get("text", ""), "second PDF text extracted")
+        ok &= check(by_url["/notes.html"].get("text") == "Stuff the ball firmly.", "HTML text extracted without scripts")
+        ok &= check("error" in by_url["/missing.pdf"], "404 recorded as an error entry")
+        ok &= check(not any("/comments" in p for p in first), "nav tab filtered out, never requested")
+        ok &= check(len(content["2.json"]) == 2, "each record gets its own download_content entries")
+        ok &= check("login" in by_url["/locked.pdf"].get("error", ""), "login redirect recorded as an error")
+        # the login page itself is requested when following the /locked.pdf redirect
+        second = sorted(p for p in second if p != "/account/login")
+        third = [p for p in third if p != "/account/login"]
+        ok &= check(second == ["/locked.pdf", "/missing.pdf"], "second run only retries the failed URLs")
+        ok &= check(len(third) == 6, "refetch requests every link again")
+        ok &= check(unchanged, "record with unchanged download_content not rewritten")
+        with open(master, encoding="utf-8") as f:
+            dataset = json.load(f)
+        ok &= check([r["pattern_id"] for r in dataset] == [1, 2] and
+                    all("download_content" in r for r in dataset), "master dataset regenerated")
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
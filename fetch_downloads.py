@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+
+Download-content stage (runs after html_to_json.py):
+- Read every pattern JSON in json_patterns_full/ and take its download_links
+- Keep only links that lead directly to a pattern file or external instructions, as described in
+  protocol.md ("downloads.links"): .pdf paths, off-Ravelry pages and Ravelry file downloads (/dl/...).
+  Ravelry view tabs, other pattern pages and store/source pages are dropped.
+- Fetch the remaining URLs concurrently through one shared requests.Session (pooled connections);
+  each URL is fetched once even if several patterns link to it, and URLs whose earlier
+  download_content entry still points at a stored file with non-empty text are not fetched again
+  (--refetch ignores those entries). A redirect to a login page is recorded as an error.
+- Store files content-addressed as ./downloaded_files/{sha256}{ext}, so identical PDFs are kept once
+- Extract text from the stored files across a process pool (PDF via pypdf, HTML via BeautifulSoup)
+- Attach the results to each pattern record under "download_content"; only records whose
+  download_content changed are rewritten, so pattern_index.py re-indexes just those
+- Regenerate the master patterns_dataset.json (as html_to_json.py writes it) when anything changed
+
+Usage:
+python fetch_downloads.py
+python fetch_downloads.py --json-dir json_patterns_full --out-dir downloaded_files --threads 8 --procs 4
+python fetch_downloads.py --cookies ravelry_cookies.json
+python fetch_downloads.py --cookies ravelry_cookies.json --refetch
+
+Ravelry-hosted files (/dl/...) need a logged-in session. Without --cookies the session is anonymous
+and those links redirect to the login page, which is recorded as an error entry and retried
+on the next run. The cookies file is the list Selenium returns
+from driver.get_cookies() after login_ravelry() in download-patterns.py, e.g.
+    json.dump(driver.get_cookies(), open("ravelry_cookies.json", "w"))
+
+Testing against a local file server:
+python check_fetch_downloads.py
+serves sample PDFs/HTML from a temp dir with http.server, runs this stage twice and checks
+dedup, text extraction, nav-tab filtering, error entries and skipping of already-stored URLs.
+
+Requires: requests, beautifulsoup4, pypdf
+"""
+import os
+import json
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from pypdf import PdfReader
+
+# === CONFIG ===
+JSON_DIR = "json_patterns_full"
+DOWNLOAD_DIR = "downloaded_files"
+MASTER_JSON = "patterns_dataset.json"
+FETCH_THREADS = 8
+EXTRACT_PROCS = os.cpu_count() or 2
+TIMEOUT_SEC = 30
+
+# Ravelry view tabs — navigation, not downloads (see protocol.md, "downloads.links")
+NAV_TABS = ("/comments", "/people", "/threads", "/report",
+            "/posts", "/yarns", "/editors", "/projects", "/stashes")
+RAVELRY_HOST = "ravelry.com"
+# Ravelry serves pattern files from /dl/...; a library page's own "download" action ends in /download
+RAVELRY_DOWNLOAD_PREFIXES = ("/dl/",)
+RAVELRY_DOWNLOAD_SUFFIXES = ("/download",)
+# A download that lands here needs a logged-in session (--cookies)
+LOGIN_PATHS = ("/account/login",)
+
+CONTENT_EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "text/html": ".html",
+    "text/plain": ".txt",
+}
+
+def ensure_dir(p):
+    if not os.path.exists(p):
+        os.makedirs(p)
+
+def is_download_link(url):
+    """
+    Allowlist: .pdf paths, off-Ravelry pages, Ravelry file downloads. Everything else on
+    Ravelry (view tabs, other patterns, stores, bundles) is navigation.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return False
+    path = parsed.path.rstrip("/").lower()
+    if any(path.endswith(tab) for tab in NAV_TABS):
+        return False
+    if path.endswith(".pdf"):
+        return True
+    host = parsed.netloc.lower().split(":")[0]
+    if host != RAVELRY_HOST and not host.endswith("." + RAVELRY_HOST):
+        return True
+    return path.startswith(RAVELRY_DOWNLOAD_PREFIXES) or path.endswith(RAVELRY_DOWNLOAD_SUFFIXES)
+
+def filter_download_links(links, pattern_page=None):
+    """
+    Keep only links that lead directly to a pattern file or external instructions.
+    """
+    kept = []
+    for url in links or []:
+        if not is_download_link(url):
+            continue
+        if pattern_page and url.rstrip("/") == pattern_page.rstrip("/"):
+            continue
+        if url not in kept:
+            kept.append(url)
+    return kept
+
+def make_session(pool_size=FETCH_THREADS):
+    """
+    One session shared by all fetch threads; the adapter pool is sized to the thread count.
+    """
+    s = requests.Session()
+    s.headers.update({"User-Agent": "Mozilla/5.0"})
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+def load_cookies(session, cookies_path):
+    """
+    Add cookies saved from Selenium (driver.get_cookies()) to a session, the same way
+    selenium_cookies_to_requests_session() in download-patterns.py does.
+    """
+    with open(cookies_path, encoding="utf-8") as f:
+        cookies = json.load(f)
+    for c in cookies:
+        session.cookies.set(c["name"], c["value"], domain=c.get("domain", None), path=c.get("path", "/"))
+    return session
+
+def guess_extension(url, content_type):
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    if ctype in CONTENT_EXTENSIONS:
+        return CONTENT_EXTENSIONS[ctype]
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext if ext in CONTENT_EXTENSIONS.values() else ".bin"
+
+def store_content(content, ext, out_dir=DOWNLOAD_DIR):
+    """
+    Write bytes under their sha256 digest; identical content is only written once.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(out_dir, digest + ext)
+    if not os.path.exists(path):
+        tmp = f"{path}.{threading.get_ident()}.part"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    return digest, path
+
+def is_login_redirect(resp):
+    return bool(resp.history) and urlparse(resp.url).path.rstrip("/").lower().startswith(LOGIN_PATHS)
+
+def fetch_one(session, url, out_dir=DOWNLOAD_DIR):
+    """
+    Fetch and store one URL. Network, HTTP and disk errors all become an {"url", "error"} entry,
+    so one failure never aborts the run.
+    """
+    try:
+        resp = session.get(url, timeout=TIMEOUT_SEC)
+        resp.raise_for_status()
+        if is_login_redirect(resp):
+            raise RuntimeError(f"redirected to login page {resp.url} (pass --cookies)")
+        content_type = resp.headers.get("Content-Type", "")
+        digest, path = store_content(resp.content, guess_extension(url, content_type), out_dir)
+    except Exception as e:
+        print(f"[fetch] Failed {url}: {e}")
+        return {"url": url, "error": str(e)}
+    return {"url": url, "sha256": digest, "file": path, "content_type": content_type.split(";")[0].strip()}
+
+def fetch_all(urls, out_dir=DOWNLOAD_DIR, threads=FETCH_THREADS, session=None):
+    """
+    Fetch unique URLs concurrently. Returns {url: fetch result}.
+    Pass a session (e.g. one carrying Ravelry cookies) to reuse its auth.
+    """
+    ensure_dir(out_dir)
+    session = session or make_session(threads)
+    results = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {pool.submit(fetch_one, session, url, out_dir): url for url in urls}
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+    return results
+
+def clean(text):
+    return " ".join((text or "").split())
+
+def extract_text(path):
+    """
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    try:
+        if path.endswith(".pdf"):
+            reader = PdfReader(path)
+            return "\n".join(page.extract_text() or "" for page in reader.pages).strip()
+        if path.endswith(".html"):
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                soup = BeautifulSoup(f, "html.parser")
+            for tag in soup(["script", "style"]):
+                tag.decompose()
+            return clean(soup.get_text(separator=" "))
+        if path.endswith(".txt"):
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                return f.read().strip()
+    except Exception as e:
+        print(f"[extract] Failed {path}: {e}")
+    return ""
+
+def extract_all(paths, procs=EXTRACT_PROCS):
+    """
+    Extract text for each distinct stored file across a process pool. Returns {path: text}.
+    """
+    paths = sorted(set(paths))
+    if not paths:
+        return {}
+    with ProcessPoolExecutor(max_workers=procs) as pool:
+        return dict(zip(paths, pool.map(extract_text, paths)))
+
+def load_records(json_dir=JSON_DIR):
+    records = {}
+    for name in os.listdir(json_dir):
+        if name.endswith(".json"):
+            path = os.path.join(json_dir, name)
+            with open(path, encoding="utf-8") as f:
+                records[path] = json.load(f)
+    return records
+
+def attach_content(record, fetched, texts):
+    """
+    Set record["download_content"]; returns True if it differs from what was there before.
+    """
+    entries = []
+    for url in filter_download_links(record.get("download_links"), record.get("pattern_page")):
+        res = fetched.get(url)
+        if not res:
+            continue
+        entry = dict(res)
+        if "file" in entry and entry["file"] in texts:
+            entry["text"] = texts[entry["file"]]
+        entries.append(entry)
+    changed = record.get("download_content") != entries
+    record["download_content"] = entries
+    return changed
+
+def previous_content(records):
+    """
+    Earlier download_content entries with extracted text whose stored file still exists, keyed by URL.
+    Entries with empty text (nothing extractable, or a bad page) are fetched again.
+    """
+    cached = {}
+    for rec in records.values():
+        for entry in rec.get("download_content") or []:
+            if "file" in entry and entry.get("text") and os.path.exists(entry["file"]):
+                cached[entry["url"]] = entry
+    return cached
+
+def write_master(records, master_json=MASTER_JSON):
+    """
+    Rewrite the merged dataset in pattern_id order, the same shape html_to_json.py produces.
+    """
+    patterns = sorted(records.values(), key=lambda r: r.get("pattern_id", 0))
+    with open(master_json, "w", encoding="utf-8") as out:
+        json.dump(patterns, out, indent=2, ensure_ascii=False)
+
+def run(json_dir=JSON_DIR, out_dir=DOWNLOAD_DIR, threads=FETCH_THREADS, procs=EXTRACT_PROCS, session=None,
+        refetch=False, master_json=MASTER_JSON):
+    records = load_records(json_dir)
+    print(f"🔍 Found {len(records)} pattern JSON files.")
+
+    urls = []
+    for rec in records.values():
+        for url in filter_download_links(rec.get("download_links"), rec.get("pattern_page")):
+            if url not in urls:
+                urls.append(url)
+    cached = {} if refetch else previous_content(records)
+    todo = [url for url in urls if url not in cached]
+    print(f"[fetch] {len(urls)} unique download links, {len(urls) - len(todo)} already stored")
+
+    fetched = fetch_all(todo, out_dir, threads, session)
+    files = [r["file"] for r in fetched.values() if "file" in r]
+    print(f"[fetch] {len(files)} fetched, {len(set(files))} distinct files stored in {out_dir}")
+    fetched.update({url: cached[url] for url in urls if url in cached})
+
+    texts = extract_all(files, procs)
+    print(f"[extract] Extracted text from {len(texts)} files")
+
+    changed = 0
+    for path, rec in records.items():
+        if not attach_content(rec, fetched, texts):
+            continue
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rec, f, indent=2, ensure_ascii=False)
+        changed += 1
+
+    if master_json and (changed or not os.path.exists(master_json)):
+        write_master(records, master_json)
+        print(f"[master] Rewrote {master_json}")
+
+    print(f"\n🎉 Updated download content for {changed} of {len(records)} patterns in {json_dir}")
+    return records
+
+def main():
+    p = argparse.ArgumentParser(description="Fetch pattern download links and attach their extracted text to the pattern JSON.")
+    p.add_argument("--json-dir", default=JSON_DIR, help="Directory of pattern JSON files")
+    p.add_argument("--out-dir", default=DOWNLOAD_DIR, help="Content-addressed store for fetched files")
+    p.add_argument("--threads", type=int, default=FETCH_THREADS, help="Concurrent fetches")
+    p.add_argument("--procs", type=int, default=EXTRACT_PROCS, help="Text extraction processes")
+    p.add_argument("--cookies", help="JSON file of Selenium cookies (driver.get_cookies()) for Ravelry downloads")
+    p.add_argument("--master-json", default=MASTER_JSON, help="Merged dataset to regenerate")
+    p.add_argument("--refetch", action="store_true", help="Fetch every link again, ignoring earlier download_content")
+    args = p.parse_args()
+    session = make_session(args.threads)
+    if args.cookies:
+        load_cookies(session, args.cookies)
+    run(args.json_dir, args.out_dir, args.threads, args.procs, session, args.refetch, args.master_json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+
+Local query service over the pattern dataset:
+- Build a SQLite index (patterns_index.db) from json_patterns_full/
+  - FTS5 table over name, description, full_text, attributes and extracted download text
+  - indexed columns / side tables for category, shape, designer, craft, techniques,
+    attributes, needle mm and languages
+  - a record's category string often joins several categories ("Softies → Animal Ball");
+    it is split into the canonical names from frequency_categories.json, and each one is
+    stored together with its parents ("Softies"), so filters match any of them
+- Update incrementally: only JSON files that are new or changed since the last sync
+  (by mtime/size) are re-indexed, and records whose file was removed are dropped
+- Python API:
+    idx = PatternIndex()
+    idx.sync()
+    idx.search(q="ball", shape="sphere", technique="worked in the round", needle_mm=4.0, language="Norwegian")
+- Local HTTP endpoint (JSON), re-syncing in the background as new JSON records are written:
+    GET /patterns?q=&category=&shape=&technique=&attribute=&needle_mm=&language=&designer=&limit=&offset=
+    GET /patterns/<pattern_id>
+
+Usage:
+python pattern_index.py build
+python pattern_index.py search --shape sphere --technique "worked in the round" --needle-mm 4.0 --language Norwegian
+python pattern_index.py serve --port 8765
+
+Only the standard library is needed (SQLite must be built with FTS5, as in CPython's bundled sqlite3).
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# === CONFIG ===
+JSON_DIR = "json_patterns_full"
+DB_PATH = "patterns_index.db"
+CATEGORIES_JSON = "frequency_categories.json"
+# bump when the tables or what gets indexed change; older index files are rebuilt
+SCHEMA_VERSION = 2
+HOST = "127.0.0.1"
+PORT = 8765
+SYNC_INTERVAL_SEC = 5
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+NEEDLE_TOLERANCE_MM = 0.05
+# totals are counted exactly up to this many matches
+COUNT_CAP = 10000
+# bm25-rank full-text hits only when there are at most this many; ranking scores every hit
+RANK_MAX_HITS = 5000
+
+# Not a language — Ravelry's "show/hide" toggle that leaks into the languages field
+LANGUAGE_NOISE = {"hide other languages", "show other languages"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    pattern_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patterns (
+    pattern_id INTEGER PRIMARY KEY,
+    name TEXT,
+    designer TEXT COLLATE NOCASE,
+    craft TEXT COLLATE NOCASE,
+    category TEXT COLLATE NOCASE,
+    shape TEXT COLLATE NOCASE,
+    pattern_page TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_patterns_designer ON patterns(designer);
+DROP INDEX IF EXISTS idx_patterns_category;
+CREATE INDEX IF NOT EXISTS idx_patterns_shape ON patterns(shape);
+
+CREATE TABLE IF NOT EXISTS pattern_techniques (pattern_id INTEGER NOT NULL, technique TEXT NOT NULL COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS pattern_attributes (pattern_id INTEGER NOT NULL, attribute TEXT NOT NULL COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS pattern_languages (pattern_id INTEGER NOT NULL, language TEXT NOT NULL COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS pattern_needles (pattern_id INTEGER NOT NULL, mm REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS pattern_categories (pattern_id INTEGER NOT NULL, category TEXT NOT NULL COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_techniques ON pattern_techniques(technique, pattern_id);
+CREATE INDEX IF NOT EXISTS idx_techniques_pid ON pattern_techniques(pattern_id);
+CREATE INDEX IF NOT EXISTS idx_attributes ON pattern_attributes(attribute, pattern_id);
+CREATE INDEX IF NOT EXISTS idx_attributes_pid ON pattern_attributes(pattern_id);
+CREATE INDEX IF NOT EXISTS idx_languages ON pattern_languages(language, pattern_id);
+CREATE INDEX IF NOT EXISTS idx_languages_pid ON pattern_languages(pattern_id);
+CREATE INDEX IF NOT EXISTS idx_needles ON pattern_needles(mm, pattern_id);
+CREATE INDEX IF NOT EXISTS idx_needles_pid ON pattern_needles(pattern_id);
+CREATE INDEX IF NOT EXISTS idx_categories ON pattern_categories(category, pattern_id);
+CREATE INDEX IF NOT EXISTS idx_categories_pid ON pattern_categories(pattern_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS patterns_fts USING fts5(
+    name, description, full_text, attributes, download_text,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+SIDE_TABLES = {
+    "pattern_techniques": "technique",
+    "pattern_attributes": "attribute",
+    "pattern_languages": "language",
+    "pattern_needles": "mm",
+    "pattern_categories": "category",
+}
+
+def needle_mm_values(needle_size):
+    """
+    Distinct mm sizes from a normalized needle string, e.g. "US 6 (4.0 mm), 3.0 mm" -> [3.0, 4.0].
+    """
+    found = re.findall(r"(\d+(?:\.\d+)?)\s*mm", needle_size or "", flags=re.I)
+    return sorted({float(x) for x in found})
+
+def clean_text(text):
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def load_category_names(path=CATEGORIES_JSON):
+    """
+    Canonical category names, longest first. frequency_categories.json carries // comments,
+    so the names are pulled out with a regex instead of json.load.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        names = set(re.findall(r'"category":\s*"([^"]+)"', f.read()))
+    return sorted(names, key=len, reverse=True)
+
+def _starts_with_name(text, names):
+    for name in names:
+        if text.startswith(name) and (len(text) == len(name) or text[len(name)] == " "):
+            return name
+    return None
+
+def split_categories(text, names):
+    """
+    Split a category string into canonical categories plus their parents, e.g.
+    "Softies → Animal Ball" -> ["Ball", "Softies", "Softies → Animal"].
+    Text not matching a known name is kept as one category up to the next known name.
+    """
+    found = []
+    rest = clean_text(text)
+    while rest:
+        name = _starts_with_name(rest, names)
+        if name is None:
+            # unknown category: runs until the next word that starts a known name
+            cut = next((i for i in range(1, len(rest)) if rest[i - 1] == " " and _starts_with_name(rest[i:], names)),
+                       len(rest))
+            name = rest[:cut].strip()
+        if not name.startswith("→"):
+            parts = name.split(" → ")
+            found += [" → ".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        rest = rest[len(name):].strip()
+    return sorted(set(found))
+
+def clean_list(values):
+    return sorted({v.strip() for v in values or [] if v and v.strip()})
+
+@contextmanager
+def connect(db_path=DB_PATH):
+    """
+    Short-lived connection: commits on success, rolls back on error, always closes.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+class PatternIndex:
+    """
+    SQLite/FTS5 index over the per-pattern JSON files. Each call opens its own
+    connection, so one instance can be shared by the HTTP server's threads.
+    """
+
+    def __init__(self, db_path=DB_PATH, json_dir=JSON_DIR, categories_path=CATEGORIES_JSON):
+        self.db_path = db_path
+        self.json_dir = json_dir
+        self.category_names = load_category_names(categories_path)
+        self._sync_lock = threading.Lock()
+        with connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # built by an older version: empty it so the next sync re-indexes every file
+                for table in ("sources", "patterns", "patterns_fts", *SIDE_TABLES):
+                    conn.execute(f"DELETE FROM {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # --- indexing ---
+
+    def _delete(self, conn, pattern_id):
+        if conn.execute("SELECT 1 FROM patterns WHERE pattern_id = ?", (pattern_id,)).fetchone() is None:
+            return
+        conn.execute("DELETE FROM patterns WHERE pattern_id = ?", (pattern_id,))
+        conn.execute("DELETE FROM patterns_fts WHERE rowid = ?", (pattern_id,))
+        for table in SIDE_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE pattern_id = ?", (pattern_id,))
+
+    def _delete_if_orphaned(self, conn, pattern_id):
+        """
+        Drop a pattern only when no remaining source file still maps to it.
+        """
+        if conn.execute("SELECT 1 FROM sources WHERE pattern_id = ?", (pattern_id,)).fetchone() is None:
+            self._delete(conn, pattern_id)
+
+    def _insert(self, conn, record):
+        pid = int(record["pattern_id"])
+        self._delete(conn, pid)
+        conn.execute(
+            "INSERT INTO patterns (pattern_id, name, designer, craft, category, shape, pattern_page, record) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (pid, record.get("name"), record.get("designer"), record.get("craft"),
+             record.get("category"), record.get("shape"), record.get("pattern_page"),
+             json.dumps(record, ensure_ascii=False)),
+        )
+        attributes = clean_list(record.get("attributes"))
+        download_text = " ".join(d.get("text", "") for d in record.get("download_content") or [])
+        conn.execute(
+            "INSERT INTO patterns_fts (rowid, name, description, full_text, attributes, download_text) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (pid, record.get("name") or "", record.get("description") or "",
+             record.get("full_text") or "", " ".join(attributes), download_text),
+        )
+        languages = [l for l in clean_list(record.get("languages")) if l.lower() not in LANGUAGE_NOISE]
+        rows = {
+            "pattern_techniques": clean_list(record.get("techniques")),
+            "pattern_attributes": attributes,
+            "pattern_languages": languages,
+            "pattern_needles": needle_mm_values(record.get("needle_size")),
+            "pattern_categories": split_categories(record.get("category"), self.category_names),
+        }
+        for table, values in rows.items():
+            conn.executemany(
+                f"INSERT INTO {table} (pattern_id, {SIDE_TABLES[table]}) VALUES (?, ?)",
+                [(pid, v) for v in values],
+            )
+        return pid
+
+    def index_record(self, record):
+        """
+        Index (or re-index) a single record, e.g. straight after it is written to disk.
+        """
+        with connect(self.db_path) as conn:
+            return self._insert(conn, record)
+
+    def sync(self):
+        """
+        Bring the index up to date with json_dir. Returns (indexed, removed) counts.
+        """
+        with self._sync_lock, connect(self.db_path) as conn:
+            # sources are keyed by file name relative to json_dir, so "json_patterns_full" and
+            # its absolute path refer to the same entries
+            known = {r["path"]: r for r in conn.execute("SELECT path, mtime, size, pattern_id FROM sources")}
+            current = {e.name: e for e in os.scandir(self.json_dir) if e.name.endswith(".json")}
+
+            # removals first, so a pattern that moved to a new file is not deleted after it is re-indexed
+            removed = [name for name in known if name not in current]
+            for name in removed:
+                conn.execute("DELETE FROM sources WHERE path = ?", (name,))
+                self._delete_if_orphaned(conn, known[name]["pattern_id"])
+
+            indexed = 0
+            for name, entry in current.items():
+                st = entry.stat()
+                old = known.get(name)
+                if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+                    continue
+                try:
+                    with open(entry.path, encoding="utf-8") as f:
+                        record = json.load(f)
+                except (OSError, ValueError) as e:
+                    # partially written file — picked up again on the next sync
+                    print(f"[index] Skipped {entry.path}: {e}")
+                    continue
+                if "pattern_id" not in record:
+                    continue
+                pid = self._insert(conn, record)
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (path, mtime, size, pattern_id) VALUES (?, ?, ?, ?)",
+                    (name, st.st_mtime, st.st_size, pid),
+                )
+                if old and old["pattern_id"] != pid:
+                    self._delete_if_orphaned(conn, old["pattern_id"])
+                indexed += 1
+            if indexed or removed:
+                # refresh planner statistics so filters pick the most selective index
+                conn.execute("PRAGMA optimize" if known else "ANALYZE")
+        return indexed, len(removed)
+
+    def watch(self, interval=SYNC_INTERVAL_SEC):
+        """
+        Re-sync every `interval` seconds on a daemon thread.
+        """
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    indexed, removed = self.sync()
+                    if indexed or removed:
+                        print(f"[index] Synced: {indexed} indexed, {removed} removed")
+                except Exception as e:
+                    print(f"[index] Sync failed: {e}")
+        t = threading.Thread(target=loop, daemon=True)
+        t.start()
+        return t
+
+    # --- querying ---
+
+    def search(self, q=None, category=None, shape=None, technique=None, attribute=None,
+               needle_mm=None, language=None, designer=None, limit=DEFAULT_LIMIT, offset=0):
+        """
+        Filter and/or full-text search. `category`, `technique`, `attribute` and `language`
+        may be a string or a list (all must match). `category` matches any of a record's
+        categories or their parents ("Softies" matches "Softies → Animal Ball").
+        Full-text hits are ranked by bm25 when there are at most RANK_MAX_HITS of them;
+        broader queries (and pure filters) are ordered by pattern_id ("ranked": false).
+        "total" is exact up to COUNT_CAP, otherwise the string ">COUNT_CAP".
+        Returns {"total", "ranked", "limit", "offset", "results": [record, ...]}.
+        """
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        offset = max(0, int(offset))
+
+        # (table, condition template on table alias {a}, params) — one entry per side-table filter value
+        side = []
+        for table, values in (("pattern_categories", category),
+                              ("pattern_techniques", technique),
+                              ("pattern_attributes", attribute),
+                              ("pattern_languages", language)):
+            if isinstance(values, str):
+                values = [values]
+            for v in values or []:
+                side.append((table, f"{{a}}.{SIDE_TABLES[table]} = ?", [v]))
+        if needle_mm is not None:
+            mm = float(needle_mm)
+            side.append(("pattern_needles", "{a}.mm BETWEEN ? AND ?",
+                         [mm - NEEDLE_TOLERANCE_MM, mm + NEEDLE_TOLERANCE_MM]))
+        columns = [(col, v) for col, v in (("shape", shape), ("designer", designer)) if v]
+
+        with connect(self.db_path) as conn:
+            def estimate(sql, params):
+                # capped row count; stops after COUNT_CAP + 1 rows
+                return conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", params + [COUNT_CAP + 1]).fetchone()[0]
+
+            fts_hits = estimate("SELECT 1 FROM patterns_fts WHERE patterns_fts MATCH ?", [q]) if q else None
+            side_est = [estimate(f"SELECT 1 FROM {t} s WHERE {cond.format(a='s')}", params)
+                        for t, cond, params in side]
+            col_est = [estimate(f"SELECT 1 FROM patterns WHERE {col} = ?", [v]) for col, v in columns]
+
+            # The most selective filter drives the query, so only its rows are visited:
+            # - FTS as the outer loop (always when the hits are few enough to rank)
+            # - a side table as the outer loop over its (value, pattern_id) index, which yields
+            #   pattern_id order and stops at LIMIT; a needle range isn't ordered, so it becomes
+            #   an IN list, and only when short
+            # - otherwise the patterns table (through a column index if the planner picks one)
+            # Every other side filter is an EXISTS probe on its (value, pattern_id) index.
+            ranked = q is not None and fts_hits <= RANK_MAX_HITS
+            smallest = min(side_est + col_est, default=None)
+            fts_drives = q is not None and (ranked or smallest is None or fts_hits <= smallest)
+            driver = None
+            if not fts_drives and side_est and min(side_est) == smallest:
+                driver = side_est.index(smallest)
+                if side[driver][0] == "pattern_needles" and smallest > COUNT_CAP:
+                    driver = None
+
+            # `pid` names the driver's pattern_id; patterns p is only joined for the count when a
+            # column filter needs it
+            where, params = [], []
+            if fts_drives:
+                base, pid = "patterns_fts f", "f.rowid"
+                where.append("patterns_fts MATCH ?")
+                params.append(q)
+                order = "f.rank" if ranked else "f.rowid"
+            elif driver is not None and side[driver][0] != "pattern_needles":
+                table, cond, values = side[driver]
+                base, pid = f"{table} d", "d.pattern_id"
+                where.append(cond.format(a="d"))
+                params += values
+                order = "d.pattern_id"
+            else:
+                base, pid = "patterns p", "p.pattern_id"
+                order = "p.pattern_id"
+            if q and not fts_drives:
+                where.append(f"{pid} IN (SELECT rowid FROM patterns_fts WHERE patterns_fts MATCH ?)")
+                params.append(q)
+            for i, (table, cond, values) in enumerate(side):
+                if i == driver and table != "pattern_needles":
+                    continue
+                if i == driver:
+                    where.append(f"{pid} IN (SELECT s.pattern_id FROM {table} s WHERE {cond.format(a='s')})")
+                else:
+                    where.append(f"EXISTS (SELECT 1 FROM {table} s WHERE {cond.format(a='s')} "
+                                 f"AND s.pattern_id = {pid})")
+                params += values
+            for col, v in columns:
+                where.append(f"p.{col} = ?")
+                params.append(v)
+            where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+            joined = base if base == "patterns p" else f"{base} CROSS JOIN patterns p ON p.pattern_id = {pid}"
+
+            n_filters = len(side) + len(columns) + (1 if q else 0)
+            if n_filters == 1:
+                # a single filter's estimate already is the capped total
+                total = (side_est + col_est + [fts_hits])[0]
+            else:
+                total = estimate(f"SELECT 1 FROM {joined if columns else base} {where_sql}", params)
+            rows = conn.execute(f"SELECT p.record FROM {joined} {where_sql} ORDER BY {order} LIMIT ? OFFSET ?",
+                                params + [limit, offset])
+            results = [json.loads(r["record"]) for r in rows]
+        return {"total": total if total <= COUNT_CAP else f">{COUNT_CAP}", "ranked": ranked,
+                "limit": limit, "offset": offset, "results": results}
+
+    def get(self, pattern_id):
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT record FROM patterns WHERE pattern_id = ?", (pattern_id,)).fetchone()
+        return json.loads(row["record"]) if row else None
+
+# --------------------------
+# HTTP endpoint
+# --------------------------
+LIST_PARAMS = ("category", "technique", "attribute", "language")
+SCALAR_PARAMS = ("q", "shape", "designer", "needle_mm", "limit", "offset")
+
+def make_handler(index):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if parts[:1] != ["patterns"] or len(parts) > 2:
+                return self._send(404, {"error": "not found"})
+            try:
+                if len(parts) == 2:
+                    record = index.get(int(parts[1]))
+                    if record is None:
+                        return self._send(404, {"error": "pattern not found"})
+                    return self._send(200, record)
+                qs = parse_qs(url.query)
+                kwargs = {k: qs[k][-1] for k in SCALAR_PARAMS if k in qs}
+                kwargs.update({k: qs[k] for k in LIST_PARAMS if k in qs})
+                return self._send(200, index.search(**kwargs))
+            except (ValueError, sqlite3.OperationalError) as e:
+                # bad int/float parameter or malformed FTS query
+                return self._send(400, {"error": str(e)})
+
+        def log_message(self, fmt, *args):
+            print(f"[serve] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+def serve(index, host=HOST, port=PORT, interval=SYNC_INTERVAL_SEC):
+    index.sync()
+    index.watch(interval)
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    print(f"🔍 Serving pattern index on http://{host}:{port}/patterns")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    p = argparse.ArgumentParser(description="Indexed local query service over the pattern JSON dataset.")
+    p.add_argument("--db", default=DB_PATH, help="SQLite index file")
+    p.add_argument("--json-dir", default=JSON_DIR, help="Directory of pattern JSON files")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("build", help="Create or incrementally update the index")
+
+    s = sub.add_parser("search", help="Query the index and print JSON results")
+    s.add_argument("-q", "--query", help="FTS5 full-text query")
+    s.add_argument("--category", action="append")
+    s.add_argument("--shape")
+    s.add_argument("--designer")
+    s.add_argument("--technique", action="append")
+    s.add_argument("--attribute", action="append")
+    s.add_argument("--language", action="append")
+    s.add_argument("--needle-mm", type=float)
+    s.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    s.add_argument("--offset", type=int, default=0)
+
+    v = sub.add_parser("serve", help="Run the local HTTP endpoint")
+    v.add_argument("--host", default=HOST)
+    v.add_argument("--port", type=int, default=PORT)
+    v.add_argument("--interval", type=float, default=SYNC_INTERVAL_SEC, help="Seconds between re-syncs")
+
+    args = p.parse_args()
+    index = PatternIndex(args.db, args.json_dir)
+
+    if args.cmd == "build":
+        start = time.time()
+        indexed, removed = index.sync()
+        print(f"🎉 Indexed {indexed} patterns ({removed} removed) into {args.db} in {time.time() - start:.1f}s")
+    elif args.cmd == "search":
+        index.sync()
+        res = index.search(q=args.query, category=args.category, shape=args.shape, designer=args.designer,
+                           technique=args.technique, attribute=args.attribute, language=args.language,
+                           needle_mm=args.needle_mm, limit=args.limit, offset=args.offset)
+        print(json.dumps(res, indent=2, ensure_ascii=False))
+    elif args.cmd == "serve":
+        serve(index, args.host, args.port, args.interval)
+
+if __name__ == "__main__":
+    main()